@@ -5,14 +5,21 @@ This file generates all graphics for debugging and documentation
 import sys
 sys.path.insert(0, 'src')
 
+import numpy as np
 import torch
-import torch.nn as nn
 import matplotlib.pyplot as plt
 from cosine_plateau_scheduler import CosinePlateauScheduler
 
 plt.switch_backend('Agg')
 
 
+def sample_schedule(base_lr: float = 1.0, **kwargs) -> np.ndarray:
+    """Return the LR at every step, read from the scheduler's precomputed table."""
+    optimizer = torch.optim.SGD([torch.zeros(1, requires_grad=True)], lr=base_lr)
+    scheduler = CosinePlateauScheduler(optimizer, precompute=True, **kwargs)
+    return scheduler._lr_table[:, 0].copy()
+
+
 def test_warmup_only():
     """Test ONLY the warmup phase (no cosine decay after)"""
     print("\n" + "="*70)
@@ -21,21 +28,8 @@ def test_warmup_only():
     
     fig, ax = plt.subplots(1, 1, figsize=(10, 6))
     
-    model = nn.Linear(10, 2)
-    optimizer = torch.optim.SGD(model.parameters(), lr=1.0)
-    
     # Total steps = warmup steps to see ONLY warmup
-    scheduler = CosinePlateauScheduler(
-        optimizer,
-        total_steps=100,
-        warmup_steps=100,
-        warmup_type='linear'
-    )
-    
-    lrs = []
-    for step in range(100):
-        lrs.append(optimizer.param_groups[0]['lr'])
-        scheduler.step()
+    lrs = sample_schedule(total_steps=100, warmup_steps=100)
     
     ax.plot(range(100), lrs, linewidth=3, color='#2563eb', label='Linear Warmup')
     ax.axhline(y=1.0, color='green', linestyle=':', alpha=0.5, linewidth=2, label='Target LR')
@@ -60,22 +54,13 @@ def test_cosine_decay_only():
     
     fig, ax = plt.subplots(1, 1, figsize=(10, 6))
     
-    model = nn.Linear(10, 2)
-    optimizer = torch.optim.SGD(model.parameters(), lr=1.0)
-    
-    scheduler = CosinePlateauScheduler(
-        optimizer,
+    lrs = sample_schedule(
         total_steps=1000,
         warmup_steps=0,  # No warmup
         min_lr_ratio=0.1,
         plateau_steps=None  # No plateaus
     )
-    
-    lrs = []
-    steps = list(range(1000))
-    for _ in range(1000):
-        lrs.append(optimizer.param_groups[0]['lr'])
-        scheduler.step()
+    steps = np.arange(1000)
     
     ax.plot(steps, lrs, linewidth=2.5, color='#e74c3c', label='Cosine Decay')
     ax.axhline(y=1.0, color='green', linestyle=':', alpha=0.4, linewidth=1.5, label='Base LR')
@@ -100,22 +85,13 @@ def test_plateaus_only():
     
     fig, ax = plt.subplots(1, 1, figsize=(12, 6))
     
-    model = nn.Linear(10, 2)
-    optimizer = torch.optim.SGD(model.parameters(), lr=1.0)
-    
-    scheduler = CosinePlateauScheduler(
-        optimizer,
+    lrs = sample_schedule(
         total_steps=1000,
         warmup_steps=0,
         min_lr_ratio=0.1,
         plateau_steps=[(30, 20), (70, 15)]  # Two plateaus
     )
-    
-    lrs = []
-    steps = list(range(1000))
-    for _ in range(1000):
-        lrs.append(optimizer.param_groups[0]['lr'])
-        scheduler.step()
+    steps = np.arange(1000)
     
     ax.plot(steps, lrs, linewidth=2.5, color='#9b59b6', label='LR Schedule')
     
@@ -148,25 +124,17 @@ def test_complete_schedule():
     
     fig, ax = plt.subplots(1, 1, figsize=(14, 6))
     
-    model = nn.Linear(10, 2)
-    optimizer = torch.optim.SGD(model.parameters(), lr=0.001)
-    
     total_steps = 10000
     warmup_steps = 1000
     
-    scheduler = CosinePlateauScheduler(
-        optimizer,
+    lrs = sample_schedule(
+        base_lr=0.001,
         total_steps=total_steps,
         warmup_steps=warmup_steps,
         min_lr_ratio=0.1,
         plateau_steps=[(50, 30), (85, 10)]
     )
-    
-    lrs = []
-    steps = list(range(total_steps))
-    for _ in range(total_steps):
-        lrs.append(optimizer.param_groups[0]['lr'])
-        scheduler.step()
+    steps = np.arange(total_steps)
     
     ax.plot(steps, lrs, linewidth=2.5, color='#2563eb', label='Learning Rate')
     
@@ -253,23 +221,15 @@ def test_multiple_configurations():
     for idx, config in enumerate(configs):
         ax = axes[idx // 2, idx % 2]
         
-        model = nn.Linear(10, 2)
-        optimizer = torch.optim.SGD(model.parameters(), lr=0.001)
-        
-        scheduler = CosinePlateauScheduler(
-            optimizer,
+        lrs = sample_schedule(
+            base_lr=0.001,
             total_steps=config['total_steps'],
             warmup_steps=config['warmup_steps'],
             min_lr_ratio=config['min_lr_ratio'],
             plateau_steps=config['plateau_steps']
         )
         
-        lrs = []
-        for _ in range(config['total_steps']):
-            lrs.append(optimizer.param_groups[0]['lr'])
-            scheduler.step()
-        
-        ax.plot(range(config['total_steps']), lrs, linewidth=2.5, color=config['color'])
+        ax.plot(np.arange(config['total_steps']), lrs, linewidth=2.5, color=config['color'])
         
         # Mark warmup if present
         if config['warmup_steps'] > 0:
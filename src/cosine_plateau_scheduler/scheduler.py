@@ -1,8 +1,13 @@
 """
 Cosine Plateau Scheduler - Advanced Learning Rate Scheduler with Warm-up and Plateau Steps
 """
+import bisect
 import math
 from typing import List, Tuple, Optional, Union
+
+import numpy as np
+import torch
+from torch import Tensor
 from torch.optim import Optimizer
 
 # Compatibility with PyTorch < 2.0 (uses _LRScheduler) and >= 2.0 (uses LRScheduler)
@@ -11,6 +16,58 @@ try:
 except ImportError:
     from torch.optim.lr_scheduler import _LRScheduler as LRScheduler
 
+# Optional: JIT-compile the per-step LR blend when numba is installed
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Above this many training steps the step -> segment lookup table is skipped
+# and segments are found by binary search on their starts (bounds memory use)
+_MAX_LOOKUP_STEPS = 10_000_000
+
+# Default size limit for the fully precomputed (total_steps, n_groups) LR table
+_MAX_LR_TABLE_BYTES = 128 * 1024 * 1024
+
+
+def _cos_pi(x):
+    """
+    Polynomial approximation of cos(pi * x) for x in [0, 1] (max error ~2e-10).
+    Uses cos(pi * x) = -cos(pi * (1 - x)) to fit only [0, 0.5].
+    """
+    sign = 1.0
+    if x > 0.5:
+        x = 1.0 - x
+        sign = -1.0
+    x2 = x * x
+    return sign * (((((-0.02439632435344239 * x2 + 0.23493731381841987) * x2
+                      - 1.335212003050996) * x2 + 4.05870915955637) * x2
+                    - 4.934802137078827) * x2 + 0.9999999997799042)
+
+
+def _cosine_blend(idx, adjusted_step, seg_start, seg_end, seg_is_plateau,
+                  start_lrs, end_lrs, out):
+    """
+    Fill out with the LR of every param group at adjusted_step,
+    which lies in segment idx. Compiled with numba when available.
+    """
+    if seg_is_plateau[idx]:
+        # Plateaus store their LR as both start and end
+        cosine_factor = 1.0
+    else:
+        progress = (adjusted_step - seg_start[idx]) / (seg_end[idx] - seg_start[idx])
+        cosine_factor = 0.5 * (1.0 + _cos_pi(progress))
+    for g in range(out.shape[0]):
+        out[g] = end_lrs[idx, g] + (start_lrs[idx, g] - end_lrs[idx, g]) * cosine_factor
+    return out
+
+
+if njit is not None:
+    _cos_pi = njit(cache=True, fastmath=True)(_cos_pi)
+    _jit_cosine_blend = njit(cache=True, fastmath=True)(_cosine_blend)
+else:
+    _jit_cosine_blend = None
+
 
 class CosinePlateauScheduler(LRScheduler):
     """
@@ -38,6 +95,9 @@ class CosinePlateauScheduler(LRScheduler):
             Example: [(50, 30)] means plateau starts at 50% and lasts 30% of remaining steps
         last_epoch (int): Index of last epoch for resuming training (default: -1)
         verbose (bool): If True, prints a message for each update (default: False)
+        precompute (bool, optional): If True, the whole schedule is computed once in
+            __init__ and each step becomes a table lookup. If None (default), the table
+            is built only when it fits in 128 MiB
     
     Example:
         >>> optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
@@ -53,6 +113,15 @@ class CosinePlateauScheduler(LRScheduler):
         ...     scheduler.step()
     """
     
+    # Attributes derived from the configuration, left out of state_dict()
+    _derived_state = (
+        '_base_lrs_np', '_min_lrs_np', '_plateau_starts', '_plateau_ends',
+        '_seg_start', '_seg_end', '_seg_is_plateau', '_seg_start_lrs', '_seg_end_lrs',
+        '_seg_lookup_start', '_seg_starts', '_seg_ends', '_step_to_seg', '_lr_table',
+        '_warmup_lrs', '_last_seg_idx', '_prev_seg_idx', '_out', '_tensor_cache',
+        '_get_step_lrs', '_get_computed_lrs',
+    )
+    
     def __init__(
         self,
         optimizer: Optimizer,
@@ -62,7 +131,8 @@ class CosinePlateauScheduler(LRScheduler):
         warmup_steps: int = 0,
         plateau_steps: Optional[List[Tuple[float, float]]] = None,
         last_epoch: int = -1,
-        verbose: bool = False
+        verbose: bool = False,
+        precompute: Optional[bool] = None
     ):
         self.total_steps = total_steps
         self.warmup_steps = warmup_steps
@@ -75,167 +145,295 @@ class CosinePlateauScheduler(LRScheduler):
         else:
             self.base_lrs = [base_lr] * len(optimizer.param_groups)
         
+        # LRScheduler.__init__ resets base_lrs to the optimizer's initial_lr,
+        # so the configured peak LRs are kept separately (and in state_dict)
+        self.max_lrs = list(self.base_lrs)
+        
         # Calculate training steps (after warmup)
         self.training_steps = total_steps - warmup_steps
         
-        # Pre-compute min_lr for each base_lr (avoid repeated multiplication)
-        self.min_lrs = [base_lr * min_lr_ratio for base_lr in self.base_lrs]
-        
-        # Process and pre-compute plateau information
-        self.plateau_regions = []
-        self.segments = []  # Pre-computed segments for fast lookup
+        # Pre-compute min_lr for each base_lr (avoid repeated multiplication).
+        # NumPy copies are used internally; the lists keep the PyTorch API.
+        self._base_lrs_np = np.asarray(self.max_lrs, dtype=np.float64)
+        self._min_lrs_np = self._base_lrs_np * min_lr_ratio
+        self.min_lrs = self._min_lrs_np.tolist()
         
+        # Process and pre-compute plateau information (sorted start/end steps)
         if plateau_steps:
-            # Parse and validate plateaus
-            for pos_pct, dur_pct in plateau_steps:
-                if not (0 <= pos_pct <= 100):
-                    raise ValueError(f"Plateau position must be between 0 and 100, got {pos_pct}")
-                if not (0 <= dur_pct <= 100):
-                    raise ValueError(f"Plateau duration must be between 0 and 100, got {dur_pct}")
-                
-                start_step = int(self.training_steps * pos_pct / 100)
-                duration = int(self.training_steps * dur_pct / 100)
-                
-                self.plateau_regions.append({
-                    'start': start_step,
-                    'end': start_step + duration,
-                })
+            positions = np.asarray([pos for pos, _ in plateau_steps], dtype=np.float64)
+            durations = np.asarray([dur for _, dur in plateau_steps], dtype=np.float64)
             
-            # Sort by start step
-            self.plateau_regions.sort(key=lambda x: x['start'])
+            # Validate, reporting the first offending value
+            invalid = ~((positions >= 0) & (positions <= 100))
+            if invalid.any():
+                pos_pct = plateau_steps[int(np.argmax(invalid))][0]
+                raise ValueError(f"Plateau position must be between 0 and 100, got {pos_pct}")
+            invalid = ~((durations >= 0) & (durations <= 100))
+            if invalid.any():
+                dur_pct = plateau_steps[int(np.argmax(invalid))][1]
+                raise ValueError(f"Plateau duration must be between 0 and 100, got {dur_pct}")
             
-            # Pre-compute total plateau duration (used for LR calculations)
-            self.total_plateau_duration = sum(p['end'] - p['start'] for p in self.plateau_regions)
-            self.effective_training_steps = self.training_steps - self.total_plateau_duration
+            starts = (self.training_steps * positions / 100).astype(np.int64)
+            ends = starts + (self.training_steps * durations / 100).astype(np.int64)
             
-            # Pre-compute LR values for each plateau and build segments
-            self._precompute_segments()
+            # Sort by start step
+            order = np.argsort(starts, kind='stable')
+            self._plateau_starts = starts[order]
+            self._plateau_ends = ends[order]
         else:
-            self.total_plateau_duration = 0
-            self.effective_training_steps = self.training_steps
-            # Single segment from 0 to training_steps
-            self.segments = [{
-                'start': 0,
-                'end': self.training_steps,
-                'type': 'cosine',
-                'start_lrs': self.base_lrs,
-                'end_lrs': self.min_lrs,
-            }]
+            self._plateau_starts = np.zeros(0, dtype=np.int64)
+            self._plateau_ends = np.zeros(0, dtype=np.int64)
+        
+        self.plateau_regions = [
+            {'start': start, 'end': end}
+            for start, end in zip(self._plateau_starts.tolist(), self._plateau_ends.tolist())
+        ]
+        
+        # Pre-compute total plateau duration (used for LR calculations)
+        self.total_plateau_duration = int(np.sum(self._plateau_ends - self._plateau_starts))
+        self.effective_training_steps = self.training_steps - self.total_plateau_duration
+        
+        # Optionally materialize the entire schedule (one row per step)
+        if precompute is None:
+            precompute = total_steps * len(self._base_lrs_np) * 8 < _MAX_LR_TABLE_BYTES
+        self.precompute = precompute
+        
+        self._build_schedule()
         
         super().__init__(optimizer, last_epoch=last_epoch)
     
+    def _build_schedule(self):
+        """
+        Build the segments, lookup tables and per-step dispatch from the
+        configuration. Called from __init__ and again by load_state_dict.
+        """
+        # Pre-compute the linear warm-up ramp from 0 to base_lr (one row per step)
+        warmup_steps = self.warmup_steps
+        warmup_factors = np.arange(max(warmup_steps, 0), dtype=np.float64) / max(warmup_steps, 1)
+        self._warmup_lrs = warmup_factors[:, None] * self._base_lrs_np
+        
+        # Pre-compute segment arrays (a single cosine segment without plateaus)
+        self._precompute_segments()
+        self._build_step_lookup()
+        self._lr_table = self._build_lr_table() if self.precompute else None
+        
+        # Specialize the per-step LR lookup once instead of branching every step
+        if warmup_steps > 0:
+            self._get_computed_lrs = self._get_warmup_or_cosine_lrs
+        else:
+            self._get_computed_lrs = self._get_cosine_lrs
+        if self._lr_table is not None:
+            self._get_step_lrs = self._get_table_lrs
+        else:
+            self._get_step_lrs = self._get_computed_lrs
+        
+        # Output buffer reused by the JIT-compiled blend
+        self._out = np.empty(len(self._base_lrs_np), dtype=np.float64)
+        
+        # Segment applied by the previous step (lets step() skip plateau rewrites)
+        self._prev_seg_idx = -1
+        
+        # Segment tensors used by lr_at, keyed by (device, dtype)
+        self._tensor_cache = {}
+    
     def _precompute_segments(self):
         """
-        Pre-compute all segments and plateau LR values.
-        This eliminates redundant calculations during training.
+        Pre-compute all segments and plateau LR values as parallel arrays.
+        This eliminates redundant calculations and dict lookups during training.
         """
         # Pre-compute plateau LR values based on global cosine progression
-        plateau_lrs = []
-        effective_position = 0
-        
-        for i, plateau in enumerate(self.plateau_regions):
-            # Calculate effective position (excluding previous plateau durations)
-            effective_position = plateau['start']
-            for j in range(i):
-                effective_position -= (self.plateau_regions[j]['end'] - self.plateau_regions[j]['start'])
-            
-            # Calculate LR at this position on the global cosine
-            if self.effective_training_steps > 0:
-                progress = effective_position / self.effective_training_steps
-                progress = max(0.0, min(1.0, progress))
-                cosine_factor = 0.5 * (1 + math.cos(math.pi * progress))
-                # Store LR values for each param group
-                plateau_lr = [
-                    min_lr + (base_lr - min_lr) * cosine_factor
-                    for base_lr, min_lr in zip(self.base_lrs, self.min_lrs)
-                ]
-            else:
-                plateau_lr = list(self.min_lrs)
-            
-            plateau_lrs.append(plateau_lr)
-        
-        # Build segments list for fast lookup
-        current_pos = 0
-        for i, plateau in enumerate(self.plateau_regions):
-            # Cosine segment before plateau
-            if current_pos < plateau['start']:
-                start_lrs = self.base_lrs if i == 0 else plateau_lrs[i - 1]
-                end_lrs = plateau_lrs[i]
-                
-                self.segments.append({
-                    'start': current_pos,
-                    'end': plateau['start'],
-                    'type': 'cosine',
-                    'start_lrs': start_lrs,
-                    'end_lrs': end_lrs,
-                })
-            
-            # Plateau segment
-            self.segments.append({
-                'start': plateau['start'],
-                'end': plateau['end'],
-                'type': 'plateau',
-                'lrs': plateau_lrs[i],
-            })
+        base_lrs = self._base_lrs_np
+        min_lrs = self._min_lrs_np
+        
+        starts = self._plateau_starts
+        ends = self._plateau_ends
+        n_plateaus = len(starts)
+        
+        if n_plateaus and self.effective_training_steps > 0:
+            # Effective position excludes the durations of all previous plateaus
+            durations = ends - starts
+            prev_durations = np.concatenate(([0], np.cumsum(durations)[:-1]))
+            effective_positions = starts - prev_durations
             
-            current_pos = plateau['end']
+            # LR at each position on the global cosine, for each param group
+            progress = np.clip(effective_positions / self.effective_training_steps, 0.0, 1.0)
+            cosine_factors = 0.5 * (1.0 + np.cos(np.pi * progress))
+            plateau_lrs = min_lrs[None, :] + (base_lrs - min_lrs)[None, :] * cosine_factors[:, None]
+        else:
+            plateau_lrs = np.tile(min_lrs, (n_plateaus, 1))
+        
+        # Candidate segments in order: cosine before each plateau, the plateau
+        # itself, then a final cosine. Plateaus store their LR as start and end.
+        n_candidates = 2 * n_plateaus + 1
+        prev_ends = np.concatenate(([0], ends[:-1]))[:n_plateaus]
+        lrs_before = np.concatenate((base_lrs[None, :], plateau_lrs))
+        
+        seg_start = np.empty(n_candidates, dtype=np.int64)
+        seg_end = np.empty(n_candidates, dtype=np.int64)
+        seg_is_plateau = np.zeros(n_candidates, dtype=bool)
+        seg_start_lrs = np.empty((n_candidates, len(base_lrs)), dtype=np.float64)
+        seg_end_lrs = np.empty((n_candidates, len(base_lrs)), dtype=np.float64)
+        
+        # Cosine segments leading into each plateau
+        seg_start[:-1:2] = prev_ends
+        seg_end[:-1:2] = starts
+        seg_start_lrs[:-1:2] = lrs_before[:-1]
+        seg_end_lrs[:-1:2] = plateau_lrs
+        
+        # Plateau segments
+        seg_start[1::2] = starts
+        seg_end[1::2] = ends
+        seg_is_plateau[1::2] = True
+        seg_start_lrs[1::2] = plateau_lrs
+        seg_end_lrs[1::2] = plateau_lrs
         
         # Final cosine segment after last plateau
-        if current_pos < self.training_steps:
-            self.segments.append({
-                'start': current_pos,
-                'end': self.training_steps,
-                'type': 'cosine',
-                'start_lrs': plateau_lrs[-1] if plateau_lrs else self.base_lrs,
-                'end_lrs': self.min_lrs,
-            })
+        seg_start[-1] = ends[-1] if n_plateaus else 0
+        seg_end[-1] = self.training_steps
+        seg_start_lrs[-1] = lrs_before[-1]
+        seg_end_lrs[-1] = min_lrs
+        
+        # Drop empty cosine segments (the final one is kept without plateaus)
+        keep = seg_is_plateau | (seg_start < seg_end)
+        keep[-1] |= n_plateaus == 0
+        
+        # LR arrays have shape (n_segments, n_groups)
+        self._seg_start = seg_start[keep]
+        self._seg_end = seg_end[keep]
+        self._seg_is_plateau = seg_is_plateau[keep]
+        self._seg_start_lrs = seg_start_lrs[keep]
+        self._seg_end_lrs = seg_end_lrs[keep]
+        
+        # Overlapping plateaus resolve to the earliest segment: starts are
+        # non-decreasing, so each segment is only looked up from the end of
+        # all earlier segments onwards. This makes the lookup ranges disjoint.
+        prev_ends = np.maximum.accumulate(np.concatenate(([0], self._seg_end[:-1])))
+        self._seg_lookup_start = np.maximum(self._seg_start, prev_ends)
+        
+        # Plain lists of boundaries for scalar lookups with bisect
+        self._seg_starts = self._seg_lookup_start.tolist()
+        self._seg_ends = self._seg_end.tolist()
     
-    def _get_warmup_lr(self, step: int, base_lr: float) -> float:
+    def _build_step_lookup(self):
         """
-        Calculate learning rate during warm-up phase.
-        Simple linear warm-up from 0 to base_lr.
+        Build the flat step -> segment table for O(1) lookup.
+        Steps not covered by any segment map to -1.
         """
-        if step >= self.warmup_steps:
-            return base_lr
+        if self.training_steps <= _MAX_LOOKUP_STEPS:
+            self._step_to_seg = np.full(max(self.training_steps, 0), -1, dtype=np.int32)
+            for i, (start, end) in enumerate(zip(self._seg_starts, self._seg_ends)):
+                if start < end:
+                    self._step_to_seg[start:end] = i
+        else:
+            self._step_to_seg = None
+        self._last_seg_idx = 0
+    
+    def _build_lr_table(self) -> np.ndarray:
+        """
+        Compute the LR of every param group at every step.
+        Returns an array of shape (total_steps, n_groups).
+        """
+        table = np.empty((max(self.total_steps, 0), len(self._base_lrs_np)), dtype=np.float64)
         
-        if self.warmup_steps == 0:
-            return base_lr
+        # Warm-up rows
+        warmup_end = min(len(self._warmup_lrs), len(table))
+        table[:warmup_end] = self._warmup_lrs[:warmup_end]
         
-        # Linear warm-up: straight line from 0 to base_lr
-        return base_lr * (step / self.warmup_steps)
+        # Training rows: steps not covered by any segment stay at min_lr
+        training = table[warmup_end:]
+        training[:] = self._min_lrs_np
+        for i in range(len(self._seg_start)):
+            start = self._seg_starts[i]
+            end = min(self._seg_ends[i], len(training))
+            if start >= end:
+                continue
+            if self._seg_is_plateau[i]:
+                training[start:end] = self._seg_start_lrs[i]
+            else:
+                # Progress is measured from the segment start, even when its
+                # first steps are covered by an earlier (overlapping) plateau
+                origin = int(self._seg_start[i])
+                local = np.arange(start - origin, end - origin, dtype=np.float64)
+                segment_length = self._seg_end[i] - origin
+                cosine_factors = 0.5 * (1.0 + np.cos(np.pi * (local / segment_length)))
+                start_lrs = self._seg_start_lrs[i]
+                end_lrs = self._seg_end_lrs[i]
+                training[start:end] = end_lrs + (start_lrs - end_lrs) * cosine_factors[:, None]
+        
+        return table
     
-    def _get_cosine_lr(self, step: int, param_group_idx: int) -> float:
+    def _segment_index(self, adjusted_step: int) -> int:
         """
-        Optimized LR calculation using pre-computed segments.
-        No redundant calculations or searches.
+        Return the index of the segment containing adjusted_step,
+        or -1 if the step lies outside every segment.
+        """
+        if self._step_to_seg is not None and adjusted_step < len(self._step_to_seg):
+            return int(self._step_to_seg[adjusted_step])
+        
+        # Large schedules (or steps past training_steps): steps arrive in order,
+        # so the last-hit segment usually still matches
+        idx = self._last_seg_idx
+        if self._seg_starts[idx] <= adjusted_step < self._seg_ends[idx]:
+            return idx
+        
+        # Crossed a segment boundary (or jumped): O(log S) binary search
+        idx = bisect.bisect_right(self._seg_starts, adjusted_step) - 1
+        if idx < 0 or adjusted_step >= self._seg_ends[idx]:
+            return -1
+        self._last_seg_idx = idx
+        return idx
+    
+    def _get_cosine_factor(self, adjusted_step: int, idx: int) -> float:
+        """
+        Return the blend coefficient between the end and start LRs of segment idx.
+        It is the same for every param group, so it is computed once per step.
+        """
+        if self._seg_is_plateau[idx]:
+            # Plateaus store their LR as both start and end
+            return 1.0
+        
+        seg_start = self._seg_start[idx]
+        progress = (adjusted_step - seg_start) / (self._seg_end[idx] - seg_start)
+        return 0.5 * (1.0 + math.cos(math.pi * progress))
+    
+    def _get_cosine_lrs(self, step: int) -> List[float]:
+        """
+        Calculate the LRs of all param groups after warm-up.
+        The segment is located once and shared by every group.
         """
         adjusted_step = step - self.warmup_steps
+        idx = self._segment_index(adjusted_step)
+        
+        if idx < 0:
+            # Past the end of the schedule
+            return list(self.min_lrs)
+        
+        if _jit_cosine_blend is not None:
+            return _jit_cosine_blend(
+                idx, adjusted_step, self._seg_start, self._seg_end, self._seg_is_plateau,
+                self._seg_start_lrs, self._seg_end_lrs, self._out
+            ).tolist()
+        
+        # One scalar factor blends every param group
+        cosine_factor = self._get_cosine_factor(adjusted_step, idx)
+        start_lrs = self._seg_start_lrs[idx]
+        end_lrs = self._seg_end_lrs[idx]
+        return (end_lrs + (start_lrs - end_lrs) * cosine_factor).tolist()
+    
+    def _get_warmup_or_cosine_lrs(self, step: int) -> List[float]:
+        """Calculate LRs when the schedule has a warm-up phase."""
+        # Warm-up phase: pre-computed linear ramp
+        if step < self.warmup_steps:
+            return self._warmup_lrs[step].tolist()
         
-        # Find the segment (typically O(1) or O(log n) with few segments)
-        # Most common case: sequential access, so check last segment first
-        for segment in self.segments:
-            if segment['start'] <= adjusted_step < segment['end']:
-                if segment['type'] == 'plateau':
-                    # Plateau: return pre-computed LR
-                    return segment['lrs'][param_group_idx]
-                else:
-                    # Cosine segment: calculate using pre-computed start/end LRs
-                    segment_length = segment['end'] - segment['start']
-                    if segment_length <= 0:
-                        return segment['start_lrs'][param_group_idx]
-                    
-                    step_in_segment = adjusted_step - segment['start']
-                    progress = step_in_segment / segment_length
-                    
-                    # Fast cosine calculation
-                    cosine_factor = 0.5 * (1.0 + math.cos(math.pi * progress))
-                    start_lr = segment['start_lrs'][param_group_idx]
-                    end_lr = segment['end_lrs'][param_group_idx]
-                    
-                    return end_lr + (start_lr - end_lr) * cosine_factor
-        
-        # Fallback (should rarely happen)
-        return self.min_lrs[param_group_idx]
+        # Training phase: use pre-computed segments
+        return self._get_cosine_lrs(step)
+    
+    def _get_table_lrs(self, step: int) -> List[float]:
+        """Read LRs from the precomputed table (computed past its end)."""
+        if step < len(self._lr_table):
+            return self._lr_table[step].tolist()
+        return self._get_computed_lrs(step)
     
     def get_lr(self) -> List[float]:
         """
@@ -245,14 +443,138 @@ class CosinePlateauScheduler(LRScheduler):
         if self.last_epoch < 0:
             return self.base_lrs
         
-        step = self.last_epoch
+        # Table lookup, warm-up ramp or segments, selected in __init__
+        return self._get_step_lrs(self.last_epoch)
+    
+    def prepare_lr_at(self, device: Union[str, torch.device] = 'cpu',
+                      dtype: torch.dtype = torch.float64):
+        """
+        Copy the segment data used by lr_at to device ahead of time.
         
-        # Warm-up phase
-        if step < self.warmup_steps:
-            return [self._get_warmup_lr(step, base_lr) for base_lr in self.base_lrs]
+        Call this eagerly before wrapping lr_at in torch.compile(fullgraph=True)
+        or capturing it in a CUDA graph, so that no host-to-device copy happens
+        inside the traced or captured region.
         
-        # Training phase: use pre-computed segments
-        return [self._get_cosine_lr(step, i) for i in range(len(self.base_lrs))]
+        Args:
+            device (str or torch.device): Device of the step tensors (default: 'cpu')
+            dtype (torch.dtype): dtype that will be passed to lr_at (default: float64)
+        """
+        self._segment_tensors(torch.empty(0, device=device).device, dtype)
+    
+    def _segment_tensors(self, device: torch.device, dtype: torch.dtype) -> tuple:
+        """Return the segment arrays as torch tensors on device (cached)."""
+        key = (device, dtype)
+        tensors = self._tensor_cache.get(key)
+        if tensors is None:
+            tensors = (
+                torch.as_tensor(self._seg_lookup_start, device=device),
+                torch.as_tensor(self._seg_start, device=device),
+                torch.as_tensor(self._seg_end, device=device),
+                torch.as_tensor(self._seg_start_lrs, device=device, dtype=dtype),
+                torch.as_tensor(self._seg_end_lrs, device=device, dtype=dtype),
+                torch.as_tensor(self._base_lrs_np, device=device, dtype=dtype),
+                torch.as_tensor(self._min_lrs_np, device=device, dtype=dtype),
+            )
+            self._tensor_cache[key] = tensors
+        return tensors
+    
+    def lr_at(self, step: Tensor, dtype: torch.dtype = torch.float64) -> Tensor:
+        """
+        Closed-form LR of every param group at step, using only torch ops.
+        
+        The computation has no Python branching on tensor values, so it can be
+        wrapped in torch.compile or captured in a CUDA graph. Segment data is
+        moved to step's device on first use; call prepare_lr_at first when
+        compiling with fullgraph=True or capturing a graph.
+        
+        Args:
+            step (Tensor): Integer step(s) of any shape
+            dtype (torch.dtype): Floating point type of the result (default: float64)
+        
+        Returns:
+            Tensor of shape step.shape + (n_groups,)
+        
+        Example:
+            >>> scheduler.prepare_lr_at('cuda')
+            >>> lrs = scheduler.lr_at(torch.tensor(500, device='cuda'))
+            >>> optimizer.param_groups[0]['lr'] = lrs[0].item()
+        """
+        lookup_start, seg_start, seg_end, start_lrs, end_lrs, base_lrs, min_lrs = (
+            self._segment_tensors(step.device, dtype)
+        )
+        step = step.to(torch.int64)
+        adjusted_step = step - self.warmup_steps
+        
+        # Segment containing each step (clamped; out-of-range steps are masked below)
+        idx = torch.searchsorted(lookup_start, adjusted_step.reshape(-1), right=True) - 1
+        idx = idx.clamp(0, len(self._seg_starts) - 1).reshape(step.shape)
+        seg_begin = seg_start[idx]
+        seg_length = (seg_end[idx] - seg_begin).clamp(min=1)
+        
+        # Plateaus store their LR as both start and end, so any factor works there
+        progress = (adjusted_step - seg_begin).to(dtype) / seg_length.to(dtype)
+        cosine_factor = 0.5 * (1.0 + torch.cos(math.pi * progress))
+        lrs = end_lrs[idx] + (start_lrs[idx] - end_lrs[idx]) * cosine_factor.unsqueeze(-1)
+        
+        # Linear warm-up before the segments, min_lr past the end of the schedule
+        warmup_lrs = base_lrs * (step.to(dtype) / max(self.warmup_steps, 1)).unsqueeze(-1)
+        past_end = (adjusted_step >= seg_end[idx]).unsqueeze(-1)
+        in_warmup = (step < self.warmup_steps).unsqueeze(-1)
+        return torch.where(in_warmup, warmup_lrs, torch.where(past_end, min_lrs, lrs))
+    
+    def step(self, epoch: Optional[int] = None):
+        """
+        Advance the schedule by one step.
+        Inside a plateau the param group LRs are already correct, so only the
+        step counter moves. With a precomputed table the new LRs are written
+        straight from the table row, bypassing the generic get_lr machinery.
+        """
+        if epoch is not None:
+            self._prev_seg_idx = -1
+            return super().step(epoch)
+        
+        next_step = self.last_epoch + 1
+        adjusted_step = next_step - self.warmup_steps
+        idx = self._segment_index(adjusted_step) if adjusted_step >= 0 else -1
+        if idx >= 0 and idx == self._prev_seg_idx and self._seg_is_plateau[idx]:
+            # Same plateau as the previous step: nothing to write
+            self._step_count += 1
+            self.last_epoch = next_step
+            return
+        self._prev_seg_idx = idx
+        
+        if self._lr_table is None or next_step >= len(self._lr_table):
+            return super().step()
+        
+        self._step_count += 1
+        self.last_epoch = next_step
+        lrs = self._lr_table[next_step].tolist()
+        for group, lr in zip(self.optimizer.param_groups, lrs):
+            if isinstance(group['lr'], Tensor):
+                group['lr'].fill_(lr)
+            else:
+                group['lr'] = lr
+        self._last_lr = lrs
+    
+    def state_dict(self) -> dict:
+        """
+        Return the scheduler state, excluding NumPy arrays, lookup structures
+        and caches derived from the configuration. Only plain Python values
+        remain, so checkpoints load with torch.load(weights_only=True).
+        """
+        state = super().state_dict()
+        for key in self._derived_state:
+            state.pop(key, None)
+        return state
+    
+    def load_state_dict(self, state_dict: dict):
+        """Load the scheduler state and rebuild every derived structure from it."""
+        super().load_state_dict(state_dict)
+        self._base_lrs_np = np.asarray(self.max_lrs, dtype=np.float64)
+        self._min_lrs_np = np.asarray(self.min_lrs, dtype=np.float64)
+        self._plateau_starts = np.asarray([p['start'] for p in self.plateau_regions], dtype=np.int64)
+        self._plateau_ends = np.asarray([p['end'] for p in self.plateau_regions], dtype=np.int64)
+        self._build_schedule()
     
     def get_last_lr(self) -> List[float]:
         """Return last computed learning rate."""
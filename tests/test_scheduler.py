@@ -1,17 +1,77 @@
 """
 Tests for CosinePlateauScheduler
 """
+import io
+import math
+
+import numpy as np
 import pytest
 import torch
-import torch.nn as nn
 from cosine_plateau_scheduler import CosinePlateauScheduler
+from cosine_plateau_scheduler import scheduler as scheduler_module
+from cosine_plateau_scheduler.scheduler import _cos_pi
+
+# Tests are independent and safe to run with pytest-xdist (pytest -n auto);
+# one intra-op thread per worker avoids oversubscribing the CPU
+torch.set_num_threads(1)
+
+# The schedule is scale-invariant in total/warmup, so loop-heavy tests use
+# a short run; the original 1000/100 configuration is kept as a slow variant
+TOTAL, WARM = 100, 10
+
+
+def _expected_lr_curve(base_lr, total, warmup, min_ratio):
+    """Closed-form LR at every step for a schedule without plateaus."""
+    t = np.arange(total, dtype=np.float64)
+    min_lr = base_lr * min_ratio
+    warmup_lrs = base_lr * t / max(warmup, 1)
+    cosine_lrs = min_lr + 0.5 * (base_lr - min_lr) * (1 + np.cos(np.pi * (t - warmup) / (total - warmup)))
+    return np.where(t < warmup, warmup_lrs, cosine_lrs)
+
+
+class _FakeOptimizer(torch.optim.Optimizer):
+    """Optimizer stub exposing only the param_groups the scheduler reads and writes."""
+    
+    def __init__(self, lrs):
+        # Skip Optimizer.__init__: no parameter validation or state setup
+        self.param_groups = [{'lr': lr, 'params': []} for lr in lrs]
+        self.defaults = {}
+        self.state = {}
+    
+    def step(self, closure=None):
+        pass
 
 
-@pytest.fixture
+def _group_lrs(optimizer):
+    """Current LR of every param group."""
+    return np.array([group['lr'] for group in optimizer.param_groups])
+
+
+@pytest.fixture(scope="module")
 def simple_optimizer():
-    """Create a simple optimizer for testing."""
-    model = nn.Linear(10, 2)
-    return torch.optim.SGD(model.parameters(), lr=0.1)
+    """Create a simple optimizer shared by the tests in this module."""
+    return _FakeOptimizer([0.1])
+
+
+@pytest.fixture(scope="session")
+def cosine_curve():
+    """LR at every step of a TOTAL/WARM run with min_lr_ratio=0.1, stepped once."""
+    optimizer = _FakeOptimizer([0.1])
+    scheduler = CosinePlateauScheduler(optimizer, TOTAL, warmup_steps=WARM, min_lr_ratio=0.1)
+    
+    lrs = np.empty(TOTAL)
+    for i in range(TOTAL):
+        lrs[i] = optimizer.param_groups[0]['lr']
+        scheduler.step()
+    return lrs
+
+
+@pytest.fixture(autouse=True)
+def _reset_lr(simple_optimizer):
+    """Restore the shared optimizer's LR so each scheduler re-reads the base LR."""
+    for group in simple_optimizer.param_groups:
+        group['lr'] = 0.1
+        group.pop('initial_lr', None)
 
 
 def test_scheduler_initialization(simple_optimizer):
@@ -29,174 +89,395 @@ def test_scheduler_initialization(simple_optimizer):
     assert scheduler.training_steps == 900
 
 
-def test_warmup_phase(simple_optimizer):
+def test_warmup_phase(cosine_curve):
     """Test that warmup increases learning rate."""
+    lrs = cosine_curve[:WARM]
+    
+    # Check that LR increases during warmup
+    assert (np.diff(lrs) > 0).all()
+    # Final warmup LR is one ramp increment below base LR
+    assert abs(lrs[-1] - 0.1 * (WARM - 1) / WARM) < 1e-9
+
+
+def test_cosine_decay(cosine_curve):
+    """Test that LR follows cosine decay after warmup."""
+    lr_after_warmup = cosine_curve[WARM]
+    lr_mid = cosine_curve[WARM + (TOTAL - WARM) * 4 // 9]
+    
+    # LR should decrease
+    assert lr_mid < lr_after_warmup
+
+
+def test_min_lr_respected(cosine_curve):
+    """Test that minimum LR is respected."""
+    base_lr = 0.1
+    min_lr_ratio = 0.1
+    min_lr = base_lr * min_lr_ratio
+    
+    # Spot-check the stepped schedule against the closed form
+    expected = _expected_lr_curve(base_lr, TOTAL, WARM, min_lr_ratio)
+    for step in (WARM, TOTAL // 2, TOTAL - 1):
+        assert abs(cosine_curve[step] - expected[step]) < 1e-9
+    
+    # Check that no LR after warmup goes below minimum
+    assert (cosine_curve[WARM:] >= min_lr - 1e-6).all()
+
+
+def test_plateau_steps(simple_optimizer):
+    """Test that plateau steps maintain constant LR."""
     scheduler = CosinePlateauScheduler(
         simple_optimizer,
-        total_steps=1000,
-        warmup_steps=100,
-        min_lr_ratio=0.1
+        total_steps=TOTAL,
+        warmup_steps=WARM,
+        min_lr_ratio=0.0,
+        plateau_steps=[(50, 20)]  # Plateau at 50% for 20% of training steps
     )
     
-    lrs = []
-    for _ in range(100):
-        lrs.append(simple_optimizer.param_groups[0]['lr'])
+    lrs = np.empty(TOTAL)
+    for i in range(TOTAL):
+        lrs[i] = simple_optimizer.param_groups[0]['lr']
         scheduler.step()
     
-    # Check that LR increases during warmup
-    assert lrs[0] < lrs[50] < lrs[99]
-    # Final warmup LR should be close to base LR
-    assert abs(lrs[99] - 0.1) < 0.01
+    # Calculate plateau region
+    training_steps = TOTAL - WARM
+    plateau_start = WARM + int(training_steps * 0.50)
+    plateau_end = plateau_start + int(training_steps * 0.20)
+    
+    # All LRs in plateau should be very similar
+    assert np.ptp(lrs[plateau_start:plateau_end]) < 1e-6
 
 
-def test_cosine_decay(simple_optimizer):
-    """Test that LR follows cosine decay after warmup."""
+def test_state_dict_round_trip_with_base_lr():
+    """Test that reloading a checkpoint keeps an explicit base_lr below the optimizer LR."""
+    optimizer = _FakeOptimizer([0.1])
     scheduler = CosinePlateauScheduler(
-        simple_optimizer,
-        total_steps=1000,
-        warmup_steps=100,
-        min_lr_ratio=0.1
+        optimizer,
+        total_steps=TOTAL,
+        base_lr=0.05,
+        warmup_steps=WARM,
+        plateau_steps=[(50, 20)]
     )
+    expected = scheduler.lr_at(torch.arange(TOTAL))[:, 0].numpy()
     
-    # Skip warmup
-    for _ in range(100):
+    lrs = np.empty(TOTAL)
+    for i in range(TOTAL):
+        lrs[i] = optimizer.param_groups[0]['lr']
+        if i == WARM + 20:
+            scheduler.load_state_dict(scheduler.state_dict())
         scheduler.step()
     
-    lr_after_warmup = simple_optimizer.param_groups[0]['lr']
+    assert np.allclose(lrs, expected, atol=1e-9)
+    assert lrs.max() <= 0.05
+    assert np.allclose(scheduler.lr_at(torch.arange(TOTAL))[:, 0].numpy(), expected)
+
+
+def test_load_state_dict_replaces_config(simple_optimizer):
+    """Test that a checkpoint fully replaces the schedule the scheduler was built with."""
+    config = dict(warmup_steps=WARM, plateau_steps=[(50, 20)])
+    scheduler1 = CosinePlateauScheduler(simple_optimizer, total_steps=TOTAL, **config)
+    for _ in range(WARM + 29):
+        scheduler1.step()
+    
+    # Built for a longer run: tables and segments must follow the checkpoint
+    optimizer2 = _FakeOptimizer([0.1])
+    scheduler2 = CosinePlateauScheduler(optimizer2, total_steps=2 * TOTAL, **config)
+    scheduler2.load_state_dict(scheduler1.state_dict())
+    assert len(scheduler2._lr_table) == TOTAL
+    
+    for _ in range(TOTAL - WARM - 29):
+        scheduler1.step()
+        scheduler2.step()
+        assert optimizer2.param_groups[0]['lr'] == simple_optimizer.param_groups[0]['lr']
+
+
+@pytest.mark.parametrize("precompute", [True, False])
+def test_plateau_stepping_writes(precompute):
+    """Test the LRs written by step() around plateaus, checkpoints and explicit epochs."""
+    config = dict(total_steps=TOTAL, warmup_steps=WARM, min_lr_ratio=0.1,
+                  plateau_steps=[(20, 20), (60, 10)], precompute=precompute)
+    optimizer = _FakeOptimizer([0.1, 0.05])
+    scheduler = CosinePlateauScheduler(optimizer, **config)
+    expected = scheduler.lr_at(torch.arange(TOTAL + 5)).numpy()
+    
+    plateau = scheduler.plateau_regions[0]
+    plateau_start, plateau_end = WARM + plateau['start'], WARM + plateau['end']
+    resume_step = (plateau_start + plateau_end) // 2
     
-    # Continue for several steps
-    for _ in range(400):
+    lrs = np.empty((TOTAL + 5, 2))
+    for i in range(TOTAL + 5):
+        lrs[i] = _group_lrs(optimizer)
+        if i == resume_step:
+            checkpoint = scheduler.state_dict()
         scheduler.step()
     
-    lr_mid = simple_optimizer.param_groups[0]['lr']
+    assert np.allclose(lrs, expected, atol=1e-9)
+    if precompute:
+        assert np.allclose(lrs[:TOTAL], scheduler._lr_table, atol=1e-12)
     
-    # LR should decrease
-    assert lr_mid < lr_after_warmup
+    # Resume in the middle of a plateau: the first step must still write
+    optimizer2 = _FakeOptimizer([0.1, 0.05])
+    scheduler2 = CosinePlateauScheduler(optimizer2, **config)
+    scheduler2.load_state_dict(checkpoint)
+    for i in range(resume_step + 1, plateau_end - 1):
+        scheduler2.step()
+        assert np.allclose(_group_lrs(optimizer2), expected[i], atol=1e-9)
+    
+    # Jump back before the plateau, then step into it again
+    scheduler2.step(plateau_start - 1)
+    assert np.allclose(_group_lrs(optimizer2), expected[plateau_start - 1], atol=1e-9)
+    scheduler2.step()
+    assert np.allclose(_group_lrs(optimizer2), expected[plateau_start], atol=1e-9)
 
 
-def test_min_lr_respected(simple_optimizer):
-    """Test that minimum LR is respected."""
-    base_lr = 0.1
-    min_lr_ratio = 0.1
-    min_lr = base_lr * min_lr_ratio
-    
+def test_plateau_lr_values(simple_optimizer):
+    """Test plateau LRs against the global cosine at the plateau's effective position."""
     scheduler = CosinePlateauScheduler(
         simple_optimizer,
-        total_steps=1000,
-        warmup_steps=0,
-        min_lr_ratio=min_lr_ratio
+        total_steps=TOTAL,
+        warmup_steps=WARM,
+        min_lr_ratio=0.1,
+        plateau_steps=[(20, 20), (60, 10)]
     )
     
-    # Run entire schedule
-    lrs = []
-    for _ in range(1000):
-        lrs.append(simple_optimizer.param_groups[0]['lr'])
+    lrs = np.empty(TOTAL)
+    for i in range(TOTAL):
+        lrs[i] = simple_optimizer.param_groups[0]['lr']
         scheduler.step()
     
-    # Check that no LR goes below minimum
-    assert all(lr >= min_lr - 1e-6 for lr in lrs)
+    # By hand: 90 training steps, plateaus at [18, 36) and [54, 63), so the
+    # cosine spans 90 - 27 = 63 steps. The second plateau's position on it
+    # excludes the first plateau's 18 steps.
+    for start, end, effective_position in ((18, 36, 18), (54, 63, 54 - 18)):
+        expected = 0.01 + 0.09 * 0.5 * (1 + math.cos(math.pi * effective_position / 63))
+        assert np.allclose(lrs[WARM + start:WARM + end], expected, atol=1e-12)
 
 
-def test_plateau_steps(simple_optimizer):
-    """Test that plateau steps maintain constant LR."""
+def test_overlapping_plateaus(simple_optimizer):
+    """Test that the earlier plateau wins where two plateaus overlap."""
     scheduler = CosinePlateauScheduler(
         simple_optimizer,
-        total_steps=1000,
-        warmup_steps=100,
-        min_lr_ratio=0.0,
-        plateau_steps=[(50, 20)]  # Plateau at 50% for 20% of training steps
+        total_steps=TOTAL,
+        plateau_steps=[(10, 50), (20, 5)]  # Second plateau lies inside the first
     )
     
-    lrs = []
-    for _ in range(1000):
-        lrs.append(simple_optimizer.param_groups[0]['lr'])
+    lrs = np.empty(TOTAL)
+    for i in range(TOTAL):
+        lrs[i] = simple_optimizer.param_groups[0]['lr']
         scheduler.step()
     
-    # Calculate plateau region
-    training_steps = 900
-    plateau_start = 100 + int(training_steps * 0.50)
-    plateau_end = plateau_start + int(training_steps * 0.20)
+    # The first plateau holds its LR over its whole range
+    assert np.ptp(lrs[10:60]) == 0
+    assert lrs[59] < 0.1
     
-    # Check that LRs in plateau are constant
-    plateau_lrs = lrs[plateau_start:plateau_end]
-    if len(plateau_lrs) > 1:
-        # All LRs in plateau should be very similar
-        assert max(plateau_lrs) - min(plateau_lrs) < 1e-6
+    # Every lookup path resolves the overlap the same way
+    assert np.allclose(lrs, scheduler._lr_table[:, 0], atol=1e-12)
+    assert np.allclose(lrs, scheduler.lr_at(torch.arange(TOTAL))[:, 0].numpy(), atol=1e-9)
 
 
-def test_invalid_plateau_values(simple_optimizer):
-    """Test that invalid plateau values raise errors."""
-    with pytest.raises(ValueError):
-        CosinePlateauScheduler(
-            simple_optimizer,
-            total_steps=1000,
-            plateau_steps=[(150, 20)]  # Invalid: position > 100
-        )
+@pytest.mark.parametrize("total, warmup", [
+    (TOTAL, WARM),
+    pytest.param(1000, 100, marks=pytest.mark.slow),
+])
+def test_stepping_matches_closed_form(simple_optimizer, total, warmup):
+    """Test that stepping the real scheduler follows the closed-form curve."""
+    scheduler = CosinePlateauScheduler(
+        simple_optimizer,
+        total_steps=total,
+        warmup_steps=warmup,
+        min_lr_ratio=0.1
+    )
+    
+    lrs = np.empty(total)
+    for i in range(total):
+        lrs[i] = simple_optimizer.param_groups[0]['lr']
+        scheduler.step()
     
+    assert np.allclose(lrs, _expected_lr_curve(0.1, total, warmup, 0.1), atol=1e-9)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"plateau_steps": [(150, 20)]},
+    {"plateau_steps": [(50, 150)]},
+    {"plateau_steps": [(-10, 20)]},
+], ids=["position>100", "duration>100", "position<0"])
+def test_invalid_config(simple_optimizer, kwargs):
+    """Test that invalid plateau values raise errors."""
     with pytest.raises(ValueError):
-        CosinePlateauScheduler(
-            simple_optimizer,
-            total_steps=1000,
-            plateau_steps=[(50, 150)]  # Invalid: duration > 100
-        )
+        CosinePlateauScheduler(simple_optimizer, total_steps=1000, **kwargs)
 
 
 def test_multiple_param_groups():
     """Test scheduler with multiple parameter groups."""
-    model = nn.Linear(10, 2)
     optimizer = torch.optim.SGD([
-        {'params': model.weight, 'lr': 0.1},
-        {'params': model.bias, 'lr': 0.01}
+        {'params': [torch.zeros(1, requires_grad=True)], 'lr': 0.1},
+        {'params': [torch.zeros(1, requires_grad=True)], 'lr': 0.01}
     ])
     
     scheduler = CosinePlateauScheduler(
         optimizer,
-        total_steps=1000,
-        warmup_steps=100
+        total_steps=TOTAL,
+        warmup_steps=WARM
     )
     
     # Both groups should have their LRs scheduled
-    initial_lrs = [group['lr'] for group in optimizer.param_groups]
-    
-    for _ in range(100):
-        scheduler.step()
-    
-    after_warmup_lrs = [group['lr'] for group in optimizer.param_groups]
+    lrs = np.empty((WARM + 1, 2))
+    for i in range(WARM + 1):
+        if i:
+            scheduler.step()
+        lrs[i] = [group['lr'] for group in optimizer.param_groups]
     
     # Both groups should have different LRs but both should increase
-    assert after_warmup_lrs[0] > initial_lrs[0]
-    assert after_warmup_lrs[1] > initial_lrs[1]
-    assert after_warmup_lrs[0] != after_warmup_lrs[1]
+    assert (np.diff(lrs, axis=0) > 0).all()
+    assert lrs[-1, 0] != lrs[-1, 1]
 
 
 def test_resume_training(simple_optimizer):
     """Test resuming training with last_epoch."""
     scheduler1 = CosinePlateauScheduler(
         simple_optimizer,
-        total_steps=1000,
-        warmup_steps=100
+        total_steps=TOTAL,
+        warmup_steps=WARM
     )
     
-    # Run for 500 steps
-    for _ in range(500):
+    # Run for half of the schedule
+    resume_step = TOTAL // 2
+    for _ in range(resume_step):
         scheduler1.step()
     
-    lr_at_500 = simple_optimizer.param_groups[0]['lr']
+    lr_at_resume = simple_optimizer.param_groups[0]['lr']
     
-    # Create new scheduler starting at step 500
-    model = nn.Linear(10, 2)
-    optimizer2 = torch.optim.SGD(model.parameters(), lr=0.1)
+    # Create new scheduler resuming after resume_step - 1; its initial step
+    # in __init__ lands on resume_step. initial_lr is what
+    # optimizer.load_state_dict restores in a real resume
+    optimizer2 = _FakeOptimizer([0.1])
+    optimizer2.param_groups[0]['initial_lr'] = 0.1
     scheduler2 = CosinePlateauScheduler(
         optimizer2,
-        total_steps=1000,
-        warmup_steps=100,
-        last_epoch=499
+        total_steps=TOTAL,
+        warmup_steps=WARM,
+        last_epoch=resume_step - 1
     )
+    assert scheduler2.last_epoch == resume_step
     
-    # Step once to get to step 500
-    scheduler2.step()
     lr_resumed = optimizer2.param_groups[0]['lr']
     
     # LRs should match (within floating point precision)
-    assert abs(lr_at_500 - lr_resumed) < 1e-6
+    assert abs(lr_at_resume - lr_resumed) < 1e-6
+
+
+def test_state_dict_round_trip(simple_optimizer):
+    """Test that a checkpoint survives torch.save/torch.load and resumes the schedule."""
+    config = dict(total_steps=TOTAL, warmup_steps=WARM, plateau_steps=[(50, 20)])
+    scheduler1 = CosinePlateauScheduler(simple_optimizer, **config)
+    for _ in range(WARM + 30):
+        scheduler1.step()
+    
+    # torch.load defaults to the weights_only unpickler since PyTorch 2.6
+    buffer = io.BytesIO()
+    torch.save(scheduler1.state_dict(), buffer)
+    buffer.seek(0)
+    state = torch.load(buffer)
+    
+    optimizer2 = _FakeOptimizer([0.1])
+    scheduler2 = CosinePlateauScheduler(optimizer2, **config)
+    scheduler2.load_state_dict(state)
+    
+    # Step both through the plateau and into the final cosine segment
+    for _ in range(TOTAL - WARM - 30):
+        scheduler1.step()
+        scheduler2.step()
+        assert optimizer2.param_groups[0]['lr'] == simple_optimizer.param_groups[0]['lr']
+
+
+def test_lr_at_matches_schedule(simple_optimizer):
+    """Test that the torch closed form matches the precomputed schedule."""
+    scheduler = CosinePlateauScheduler(
+        simple_optimizer,
+        total_steps=1000,
+        warmup_steps=100,
+        min_lr_ratio=0.1,
+        plateau_steps=[(50, 20)]
+    )
+    
+    lrs = scheduler.lr_at(torch.arange(1100))[:, 0]
+    expected = torch.as_tensor(scheduler._lr_table[:, 0])
+    
+    assert torch.allclose(lrs[:1000], expected, atol=1e-9)
+    # Past the end of the schedule the LR stays at min_lr
+    assert torch.allclose(lrs[1000:], torch.full((100,), 0.01, dtype=torch.float64))
+
+
+@pytest.mark.parametrize("path", ["table", "computed", "bisect", "jit"])
+def test_lr_paths_match_table(monkeypatch, path):
+    """Test that every per-step LR path reproduces the precomputed table."""
+    if path == "jit":
+        if scheduler_module._jit_cosine_blend is None:
+            pytest.skip("numba is not installed")
+    else:
+        monkeypatch.setattr(scheduler_module, "_jit_cosine_blend", None)
+    if path == "bisect":
+        # Force the binary search fallback used for very long schedules
+        monkeypatch.setattr(scheduler_module, "_MAX_LOOKUP_STEPS", 0)
+    
+    config = dict(total_steps=TOTAL, warmup_steps=WARM, min_lr_ratio=0.1,
+                  plateau_steps=[(20, 20), (60, 10)])
+    expected = CosinePlateauScheduler(_FakeOptimizer([0.1, 0.05]), precompute=True, **config)._lr_table
+    
+    optimizer = _FakeOptimizer([0.1, 0.05])
+    scheduler = CosinePlateauScheduler(optimizer, precompute=(path == "table"), **config)
+    assert (scheduler._lr_table is not None) == (path == "table")
+    assert (scheduler._step_to_seg is None) == (path == "bisect")
+    
+    lrs = np.empty((TOTAL, 2))
+    for i in range(TOTAL):
+        lrs[i] = [group['lr'] for group in optimizer.param_groups]
+        scheduler.step()
+    
+    assert np.allclose(lrs, expected, atol=1e-9)
+    # Past the end of the schedule every path falls back to min_lr
+    assert optimizer.param_groups[0]['lr'] == pytest.approx(0.01)
+
 
+def test_lr_at_compiles_fullgraph(simple_optimizer):
+    """Test that lr_at traces as a single graph once its segment data is prepared."""
+    if not hasattr(torch, "compile"):
+        pytest.skip("torch.compile requires PyTorch 2.0")
+    scheduler = CosinePlateauScheduler(
+        simple_optimizer,
+        total_steps=TOTAL,
+        warmup_steps=WARM,
+        plateau_steps=[(50, 20)]
+    )
+    scheduler.prepare_lr_at('cpu')
+    
+    # The eager backend checks tracing without needing a C++ toolchain
+    compiled_lr_at = torch.compile(scheduler.lr_at, fullgraph=True, backend="eager")
+    steps = torch.arange(TOTAL)
+    assert torch.allclose(compiled_lr_at(steps), scheduler.lr_at(steps))
+
+
+def test_step_perf(request, simple_optimizer):
+    """Test that a computed (non-table) step stays cheap, e.g. no per-step tensor math."""
+    pytest.importorskip("pytest_benchmark")
+    benchmark = request.getfixturevalue("benchmark")
+    scheduler = CosinePlateauScheduler(
+        simple_optimizer,
+        total_steps=1_000_000,
+        warmup_steps=100,
+        precompute=False
+    )
+    
+    benchmark(lambda: [scheduler.step() for _ in range(100)])
+    
+    # Benchmarks are disabled under xdist; only check timings when measured
+    if not benchmark.disabled:
+        assert benchmark.stats.stats.mean < 2e-3
+
+
+def test_cos_pi_approximation():
+    """Test that the polynomial cosine stays within 1e-7 of math.cos on [0, 1]."""
+    max_err = max(
+        abs(_cos_pi(i / 10000) - math.cos(math.pi * i / 10000))
+        for i in range(10001)
+    )
+    assert max_err < 1e-7